@@ -0,0 +1,126 @@
+import itertools
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Sequence
+
+from .cache import VectorIndex
+from .config import (
+    ANSWER_CACHE_MAXSIZE,
+    ANSWER_CACHE_MIN_OVERLAP,
+    ANSWER_CACHE_SIMILARITY,
+)
+
+
+_CITATION = re.compile(r"\[(\d+)\]")
+_REFERENCE_LINE = re.compile(r"\s*\[(\d+)\]")
+
+
+class _Entry(NamedTuple):
+    chunk_ids: List[str]  # in the order they were numbered [1], [2], ... in the prompt
+    answer: str
+    sources: FrozenSet[str]
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class AnswerCache:
+    """Cache of generated answers that is only reused when the evidence still matches.
+
+    A cached answer is returned for a new question only if the question embedding
+    is close to the cached one AND the retrieved chunk IDs overlap enough
+    (Jaccard). Every chunk the cached answer cites must also be among the new
+    chunks; its [n] citations are renumbered to the new chunk order.
+
+    The overlap check is only meaningful if chunks were retrieved for the new
+    question itself; hits borrowed from a similar query's cache entry always pass,
+    so callers skip this cache for them (see retrieval.search_with_origin).
+    """
+
+    def __init__(
+        self,
+        maxsize: int = ANSWER_CACHE_MAXSIZE,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+        min_overlap: float = ANSWER_CACHE_MIN_OVERLAP,
+    ):
+        self.maxsize = maxsize
+        self.similarity = similarity
+        self.min_overlap = min_overlap
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._vectors = VectorIndex(maxsize)
+
+    def get(self, vector: Sequence[float], chunks: List[Dict]) -> Optional[str]:
+        chunk_ids = [c["id"] for c in chunks]
+        id_set = frozenset(chunk_ids)
+        with self._lock:
+            for key in self._vectors.search(vector, self.similarity):
+                entry = self._entries[key]
+                if jaccard(frozenset(entry.chunk_ids), id_set) < self.min_overlap:
+                    continue
+                answer = _renumber_citations(entry.answer, entry.chunk_ids, chunk_ids)
+                if answer is None:
+                    continue
+                self._entries.move_to_end(key)
+                return answer
+            return None
+
+    def set(self, vector: Sequence[float], chunks: List[Dict], answer: str) -> None:
+        entry = _Entry(
+            chunk_ids=[c["id"] for c in chunks],
+            answer=answer,
+            sources=frozenset(c["source"] for c in chunks),
+        )
+        with self._lock:
+            key = next(self._ids)
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._evict(next(iter(self._entries)))
+            self._vectors.add(key, vector)
+
+    def invalidate(self, source: str) -> None:
+        """Drop every answer grounded in source, e.g. after it is re-ingested."""
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if source in e.sources]:
+                self._evict(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+
+    def _evict(self, key: int) -> None:
+        self._entries.pop(key, None)
+        self._vectors.remove(key)
+
+
+def _renumber_citations(answer: str, old_ids: List[str], new_ids: List[str]) -> Optional[str]:
+    """Rewrite [n] citations from old_ids numbering to new_ids, or None if a cited chunk is missing."""
+    new_positions = {chunk_id: i for i, chunk_id in enumerate(new_ids, 1)}
+    mapping = {}
+    for n in {int(m) for m in _CITATION.findall(answer)}:
+        if not 1 <= n <= len(old_ids) or old_ids[n - 1] not in new_positions:
+            return None
+        mapping[n] = new_positions[old_ids[n - 1]]
+    return _sort_references(_CITATION.sub(lambda m: f"[{mapping[int(m.group(1))]}]", answer))
+
+
+def _sort_references(answer: str) -> str:
+    """Put the [n] lines of the trailing References section back in ascending order."""
+    head, sep, tail = answer.rpartition("References:")
+    if not sep:
+        return answer
+    lines = tail.split("\n")
+    rows = [i for i, line in enumerate(lines) if _REFERENCE_LINE.match(line)]
+    ordered = sorted((lines[i] for i in rows), key=lambda line: int(_REFERENCE_LINE.match(line).group(1)))
+    for i, line in zip(rows, ordered):
+        lines[i] = line
+    return head + sep + "\n".join(lines)
+
+
+answer_cache = AnswerCache()
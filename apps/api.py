@@ -1,19 +1,49 @@
+from contextlib import asynccontextmanager
+from functools import partial
+
+import anyio
+import orjson
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
+
+from .config import PINECONE_MAX_CONCURRENCY
+from .ingestion import iter_records
+from .embedding import _get_or_create_index, upsert_chunks
+from .retrieval import _get_index as _get_search_index, embed_query, search, search_with_origin
+from .reranker import batched_reranker
+from .generation import agenerate_answer, astream_answer, precheck_answer
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Resolve the Pinecone index at boot so the first request doesn't pay for it, and run
+    the rerank batcher for the lifetime of the app."""
+    try:
+        await anyio.to_thread.run_sync(_get_or_create_index)
+        await anyio.to_thread.run_sync(_get_search_index)
+    except Exception as e:
+        # Requests will retry the lookup, so a Pinecone outage at boot shouldn't block startup.
+        print(f"Pinecone index warm-up failed: {e}")
+    batched_reranker.start()
+    try:
+        yield
+    finally:
+        await batched_reranker.stop()
 
-from .ingestion import ingest_document
-from .embedding import upsert_chunks
-from .retrieval import search
-from .reranker import rerank
-from .generation import generate_answer
 
 app = FastAPI(
     title="RAG Pipeline API",
     description="API for the RAG pipeline with ingestion, embedding, retrieval, reranking, and generation.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
+# Pinecone's client is blocking, so its calls run in worker threads. They get their own
+# limiter so a burst of requests is not capped by anyio's default 40-thread pool.
+_pinecone_limiter = anyio.CapacityLimiter(PINECONE_MAX_CONCURRENCY)
+
 
 # --------------- Request / Response Models ---------------
 
@@ -73,19 +103,53 @@ class ChatResponse(BaseModel):
 
 # --------------- Helper ---------------
 
-def _hits_to_source_chunks(hits: list) -> List[SourceChunk]:
-    """Convert raw hit dicts from retrieval/reranker into SourceChunk models."""
-    chunks = []
-    for h in hits:
-        chunks.append(SourceChunk(
-            id=h.get("id", ""),
-            score=h.get("score", 0.0),
-            source=h.get("source", ""),
-            pages=h.get("pages", ""),
-            chunk_text=h.get("chunk_text", ""),
-            citation=f"{h.get('source', '')}, p.{h.get('pages', '')}",
-        ))
-    return chunks
+def _hits_to_source_chunks(hits: list) -> List[Dict]:
+    """Convert raw hit dicts from retrieval/reranker into SourceChunk-shaped dicts.
+
+    Hits are built by retrieval.search with every field set, so no model is built;
+    responses are encoded straight from dicts by orjson.
+    """
+    return [
+        {
+            "id": h["id"],
+            "score": h["score"],
+            "source": h["source"],
+            "pages": h["pages"],
+            "chunk_text": h["chunk_text"],
+            "citation": f"{h['source']}, p.{h['pages']}",
+        }
+        for h in hits
+    ]
+
+
+async def _run_blocking(func, *args, **kwargs):
+    """Run a blocking Pinecone call in a worker thread without stalling the event loop."""
+    return await anyio.to_thread.run_sync(partial(func, *args, **kwargs), limiter=_pinecone_limiter)
+
+
+async def _retrieve_context(request: ChatRequest):
+    """Retrieve (and optionally rerank) chunks for a chat request.
+
+    Returns (answer_vector, retrieved_hits, reranked_hits, context_hits); reranked_hits
+    is None when the reranker is off. answer_vector is the query embedding for the
+    answer cache, or None when the hits were borrowed from a similar query's cache
+    entry: the answer cache checks the evidence, and borrowed hits would always pass.
+    """
+    # Embed once; the vector drives the Pinecone query and the semantic cache lookups.
+    query_vector = await _run_blocking(embed_query, request.question)
+    retrieved_hits, borrowed = await _run_blocking(
+        search_with_origin, request.question, top_k=request.top_k, vector=query_vector,
+    )
+    answer_vector = None if borrowed else query_vector
+
+    if request.use_reranker:
+        # Concurrent requests share one batched cross-encoder pass over the hits we already have.
+        reranked_hits = await batched_reranker.rerank(
+            request.question, retrieved_hits, top_k=request.top_k, top_n=request.top_n,
+        )
+        return answer_vector, retrieved_hits, reranked_hits, reranked_hits
+
+    return answer_vector, retrieved_hits, None, retrieved_hits
 
 
 # --------------- Endpoints ---------------
@@ -96,17 +160,20 @@ def health_check():
     return {"status": "ok"}
 
 
-@app.post("/ingest", response_model=IngestResponse)
-def ingest_endpoint(request: IngestRequest):
+# Endpoints return ORJSONResponse directly, so FastAPI skips re-validating and re-encoding
+# the payload; the response models below are kept for the OpenAPI schema only.
+
+@app.post("/ingest", response_model=None, responses={200: {"model": IngestResponse}})
+async def ingest_endpoint(request: IngestRequest):
     """Ingest a document: extract text, chunk it, embed, and upsert into Pinecone."""
     try:
-        result = ingest_document(request.file_path)
-        upserted = upsert_chunks(result)
-        return IngestResponse(
-            file=request.file_path,
-            chunk=upserted,
-            message="Ingestion successful",
-        )
+        # Records are streamed: chunking keeps running while earlier batches upload.
+        upserted = await _run_blocking(upsert_chunks, iter_records(request.file_path))
+        return ORJSONResponse({
+            "file": request.file_path,
+            "chunk": upserted,
+            "message": "Ingestion successful",
+        })
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
     except ValueError as ve:
@@ -115,55 +182,88 @@ def ingest_endpoint(request: IngestRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/search", response_model=SearchResponse)
-def search_endpoint(request: SearchRequest):
+@app.post("/search", response_model=None, responses={200: {"model": SearchResponse}})
+async def search_endpoint(request: SearchRequest):
     """Retrieve relevant chunks for a query using semantic search, optionally with reranking."""
     try:
         if request.use_reranker:
-            hits = rerank(request.query, top_k=request.top_k)
+            hits = await _run_blocking(search, request.query, top_k=request.top_k)
+            hits = await batched_reranker.rerank(request.query, hits, top_k=request.top_k)
             pipeline = "retrieval + reranker"
         else:
-            hits = search(request.query, top_k=request.top_k)
+            hits = await _run_blocking(search, request.query, top_k=request.top_k)
             pipeline = "retrieval only"
 
-        return SearchResponse(
-            query=request.query,
-            chunks=_hits_to_source_chunks(hits),
-            pipeline=pipeline,
-        )
+        return ORJSONResponse({
+            "query": request.query,
+            "chunks": _hits_to_source_chunks(hits),
+            "pipeline": pipeline,
+        })
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/chat", response_model=ChatResponse)
-def chat_endpoint(request: ChatRequest):
+@app.post("/chat", response_model=None, responses={200: {"model": ChatResponse}})
+async def chat_endpoint(request: ChatRequest):
     """End-to-end RAG: retrieve chunks, optionally rerank, and generate a cited answer."""
     try:
-        retrieved_hits = search(request.question, top_k=request.top_k)
+        answer_vector, retrieved_hits, reranked_hits, context_hits = await _retrieve_context(request)
 
-        if request.use_reranker:
-            reranked_hits = rerank(request.question, top_k=request.top_k, top_n=request.top_n)
-            context_hits = reranked_hits
-        else:
-            reranked_hits = None
-            context_hits = retrieved_hits
+        answer = await agenerate_answer(request.question, context_hits, query_vector=answer_vector)
 
-        answer = generate_answer(request.question, context_hits)
-
-        response = ChatResponse(
-            answer=answer,
-            source_chunks=_hits_to_source_chunks(context_hits),
-        )
+        response = {
+            "answer": answer,
+            "source_chunks": _hits_to_source_chunks(context_hits),
+            "retrieved": None,
+            "reranked": None,
+        }
 
         if request.debug:
-            response.retrieved = _hits_to_source_chunks(retrieved_hits)
+            response["retrieved"] = _hits_to_source_chunks(retrieved_hits)
             if reranked_hits is not None:
-                response.reranked = _hits_to_source_chunks(reranked_hits)
+                response["reranked"] = _hits_to_source_chunks(reranked_hits)
+
+        return ORJSONResponse(response)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 
-        return response
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """Like /chat, but streams the answer as Server-Sent Events while it is generated.
+
+    The first event (``event: sources``) carries the source chunks so citations can be
+    rendered right away. Each following ``data:`` event is ``{"token": "..."}``, and the
+    stream ends with ``data: [DONE]``. Errors found before streaming starts (such as
+    a missing API key) are returned with an HTTP status like /chat; a failure during
+    generation is sent as ``event: error``.
+    """
+    try:
+        answer_vector, _, _, context_hits = await _retrieve_context(request)
+        # Checked before the 200 headers go out, so e.g. a missing API key gets the same
+        # 400 as /chat rather than an error event.
+        ready_answer = precheck_answer(request.question.strip(), context_hits, answer_vector)
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        sources = _hits_to_source_chunks(context_hits)
+        yield b"event: sources\ndata: " + orjson.dumps(sources) + b"\n\n"
+        try:
+            if ready_answer is not None:
+                yield b"data: " + orjson.dumps({"token": ready_answer}) + b"\n\n"
+            else:
+                async for token in astream_answer(request.question, context_hits, query_vector=answer_vector):
+                    yield b"data: " + orjson.dumps({"token": token}) + b"\n\n"
+        except Exception as e:
+            yield b"event: error\ndata: " + orjson.dumps({"detail": str(e)}) + b"\n\n"
+            return
+        yield b"data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import (
+    QUERY_CACHE_MAXSIZE,
+    QUERY_CACHE_SIMILARITY,
+    QUERY_CACHE_TTL,
+)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class VectorIndex:
+    """Fixed-capacity set of unit vectors searchable by cosine similarity.
+
+    Vectors live in one (capacity, d) matrix so a lookup is a single
+    matrix-vector product. Not thread-safe; owners hold their own lock.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._vectors: Optional[np.ndarray] = None
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, key: Hashable, vector: Sequence[float]) -> None:
+        v = _unit(vector)
+        if self._vectors is None or self._vectors.shape[1] != v.shape[0]:
+            self._vectors = np.zeros((self.capacity, v.shape[0]), dtype=np.float32)
+            self._reset_rows()
+        row = self._rows.get(key)
+        if row is None:
+            row = self._free.pop()
+            self._rows[key] = row
+            self._keys[row] = key
+        self._vectors[row] = v
+
+    def remove(self, key: Hashable) -> None:
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._vectors[row] = 0.0
+            self._keys[row] = None
+            self._free.append(row)
+
+    def search(self, vector: Sequence[float], threshold: float) -> List[Hashable]:
+        """Keys whose vectors have cosine similarity >= threshold with vector, best first."""
+        q = _unit(vector)
+        if not self._rows or self._vectors.shape[1] != q.shape[0]:
+            return []
+        sims = self._vectors @ q
+        candidates = np.flatnonzero(sims >= threshold)
+        return [
+            self._keys[row]
+            for row in candidates[np.argsort(-sims[candidates])]
+            if self._keys[row] is not None
+        ]
+
+    def clear(self) -> None:
+        self._reset_rows()
+        if self._vectors is not None:
+            self._vectors[:] = 0.0
+
+    def _reset_rows(self) -> None:
+        self._rows: Dict[Hashable, int] = {}
+        self._keys: List[Optional[Hashable]] = [None] * self.capacity
+        self._free: List[int] = list(range(self.capacity - 1, -1, -1))
+
+
+class QueryCache:
+    """Two-tier cache of search hits.
+
+    The first tier is an exact-match LRU keyed by the normalized query and the
+    search parameters. The second tier compares query embeddings by cosine
+    similarity, so paraphrases of a cached query reuse its hits.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = QUERY_CACHE_MAXSIZE,
+        ttl: float = QUERY_CACHE_TTL,
+        threshold: float = QUERY_CACHE_SIMILARITY,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        # (query_norm, params) -> (expires_at, hits)
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[float, List[Dict]]]" = OrderedDict()
+        self._vectors = VectorIndex(maxsize)
+
+    def get(self, query: str, params: Hashable = ()) -> Optional[List[Dict]]:
+        key = (normalize_query(query), params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._evict(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def get_similar(self, vector: Sequence[float], params: Hashable = ()) -> Optional[List[Dict]]:
+        with self._lock:
+            for key in self._vectors.search(vector, self.threshold):
+                if key[1] != params:
+                    continue
+                expires_at, hits = self._entries[key]
+                if expires_at < time.monotonic():
+                    self._evict(key)
+                    continue
+                self._entries.move_to_end(key)
+                return hits
+            return None
+
+    def set(
+        self,
+        query: str,
+        hits: List[Dict],
+        params: Hashable = (),
+        vector: Optional[Sequence[float]] = None,
+    ) -> None:
+        key = (normalize_query(query), params)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, hits)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._evict(next(iter(self._entries)))
+            if vector is not None:
+                self._vectors.add(key, vector)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+
+    def _evict(self, key: Tuple[str, Hashable]) -> None:
+        self._entries.pop(key, None)
+        self._vectors.remove(key)
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+retrieval_cache = QueryCache()
+rerank_cache = QueryCache()
+
+
+def clear_query_caches() -> None:
+    """Drop every cached hit list; called after new records are upserted."""
+    retrieval_cache.clear()
+    rerank_cache.clear()
@@ -8,13 +8,26 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 # Chunking Settings
 CHUNK_SIZE: int = 512 # Number of characters per chunk
 CHUNK_OVERLAP: int = 64 # Number of characters to overlap between chunks
+# Extraction Settings
+PDF_EXTRACT_WORKERS: int = os.cpu_count() or 1 # Processes used to extract PDF page text
+PDF_PARALLEL_MIN_PAGES: int = 128 # Smaller PDFs are extracted in-process to skip pool startup
 # Pinecone Settings
 PINECONE_INDEX_NAME: str = "rag-pipeline-classic"
 PINECONE_NAMESPACE: str = "documents"
 PINECONE_CLOUD: str = "aws"
 PINECONE_REGION: str = "us-east-1"
 PINECONE_EMBED_MODEL: str = "multilingual-e5-large"
-PINECONE_RERANK_MODEL: str = "bge-reranker-v2-m3"
+PINECONE_UPSERT_BATCH_SIZE: int = 96 # Max records per upsert_records call (Pinecone's cap for integrated-embedding upserts)
+PINECONE_UPSERT_MAX_BYTES: int = 1_800_000 # Target payload per upsert call, under Pinecone's 2MB request limit
+PINECONE_UPSERT_WORKERS: int = 30 # Upsert batches in flight at once
+PINECONE_UPSERT_MAX_PENDING: int = 60 # Batches queued or in flight before ingestion waits on Pinecone
+PINECONE_DELETE_BATCH_SIZE: int = 1000 # IDs per delete call (Pinecone's limit) when rolling back a failed ingest
+
+# Reranker Settings
+FLASHRANK_MODEL: str = "ms-marco-MiniLM-L-12-v2" # Local ONNX cross-encoder used for reranking
+FLASHRANK_CACHE_DIR: str = os.path.join(os.path.expanduser("~"), ".cache", "flashrank") # Where the model is downloaded
+RERANK_MAX_BATCH: int = 16 # Max concurrent rerank requests scored in one forward pass
+RERANK_BATCH_TIMEOUT_MS: float = 50.0 # How long a rerank request waits for others to batch with
 
 # Retrieval Settings
 TOP_K: int = 10 # Number of top relevant chunks to retrieve
@@ -24,4 +37,16 @@ RERANK_TOP_N: int = 5 # Number of top chunks to rerank and return
 OPENAI_MODEL: str = "gpt-4o-mini" # OpenAI model for generation
 #OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 MAX_TOKENS: int = 1024 # Maximum tokens for generated response
-TEMPERATURE: float = 0.2 # Sampling temperature for generation      
\ No newline at end of file
+TEMPERATURE: float = 0.2 # Sampling temperature for generation
+OPENAI_PROMPT_CACHE_KEY: str = "rag-v1" # Shared cache key so every request hits the same cached system prompt
+
+# API Settings
+PINECONE_MAX_CONCURRENCY: int = 64 # Max concurrent worker threads for blocking Pinecone calls
+
+# Cache Settings
+QUERY_CACHE_MAXSIZE: int = 1024 # Max cached queries per cache
+QUERY_CACHE_TTL: float = 3600.0 # Seconds before a cached hit list expires
+QUERY_CACHE_SIMILARITY: float = 0.95 # Cosine similarity needed to reuse a paraphrased query's hits
+ANSWER_CACHE_MAXSIZE: int = 2048 # Max cached generated answers
+ANSWER_CACHE_SIMILARITY: float = 0.92 # Cosine similarity between questions needed to reuse an answer
+ANSWER_CACHE_MIN_OVERLAP: float = 0.7 # Jaccard overlap of retrieved chunk IDs needed to reuse an answer
@@ -1,13 +1,26 @@
+import json
+import threading
 import time 
-from typing import List, Dict 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, Optional
 from pinecone import Pinecone 
+from pinecone.db_data import Index
+from .answer_cache import answer_cache
+from .cache import clear_query_caches
 from .config import (
     PINECONE_API_KEY,
     PINECONE_INDEX_NAME,
     PINECONE_NAMESPACE,
     PINECONE_CLOUD,
     PINECONE_REGION,
-    PINECONE_EMBED_MODEL
+    PINECONE_EMBED_MODEL,
+    PINECONE_DELETE_BATCH_SIZE,
+    PINECONE_UPSERT_BATCH_SIZE,
+    PINECONE_UPSERT_MAX_BYTES,
+    PINECONE_UPSERT_MAX_PENDING,
+    PINECONE_UPSERT_WORKERS,
 )
 
 
@@ -15,7 +28,22 @@ from .config import (
 
 _pc= Pinecone(api_key=PINECONE_API_KEY)
 
-def _get_or_create_index():
+# The Index handle is resolved once: has_index/describe are network calls.
+_index: Optional[Index] = None
+_index_lock = threading.Lock()
+
+def _get_or_create_index() -> Index:
+    global _index
+    if _index is not None:
+        return _index
+
+    with _index_lock:
+        if _index is None:
+            _index = _create_index()
+    return _index
+
+
+def _create_index() -> Index:
 
     if not _pc.has_index(PINECONE_INDEX_NAME):
         print(f"Creating Pinecone Index {PINECONE_INDEX_NAME} with integrated Embedding")
@@ -37,7 +65,12 @@ def _get_or_create_index():
         
         print("Index Created and Ready")
 
-    return _pc.Index(PINECONE_INDEX_NAME)
+    # Upserts run concurrently on upsert_chunks' own thread pool, so the HTTP pool only
+    # needs one connection per worker (pool_threads is for async_req, which we don't use).
+    return _pc.Index(
+        PINECONE_INDEX_NAME,
+        connection_pool_maxsize=PINECONE_UPSERT_WORKERS,
+    )
 
 
 def is_file_ingested(source:str)-> bool:
@@ -45,57 +78,121 @@ def is_file_ingested(source:str)-> bool:
     index= _get_or_create_index()
 
     try:
-        results= index.search(
-            namespace= PINECONE_NAMESPACE,
-            query={"top_k":1, "inputs": {"text": source}},
-            fields=["source"]
-        )
+        # Record IDs are "{file_name}::chunk_{n}" (see ingestion.iter_records), so listing
+        # one ID by prefix answers this without embedding anything or running a search.
+        ids = next(index.list(prefix=f"{source}::", namespace=PINECONE_NAMESPACE, limit=1), [])
+        return len(ids) > 0
+    except Exception as e:
+        print(f"Listing IDs failed for source '{source}', falling back to a metadata query: {e}")
 
-        for hit in results.result.hits:
-            if hit["fields"].get("source") == source:
-                return True 
+    try:
+        dimension = _pc.describe_index(PINECONE_INDEX_NAME).dimension
+        # Any non-zero vector works; the metadata filter decides whether a match exists.
+        probe = [1.0] + [0.0] * (dimension - 1)
+        results = index.query(
+            namespace=PINECONE_NAMESPACE,
+            vector=probe,
+            top_k=1,
+            filter={"source": {"$eq": source}},
+            include_metadata=False,
+        )
+        return len(results.matches) > 0
     except Exception as e:
         print(f"Error checking existing records for source '{source}': {e}")
         return False
 
-    return False
 
+def _batched(items: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _batch_size_for(record: Dict) -> int:
+    """Largest batch of records like this one that fits both Pinecone upsert limits."""
+    record_bytes = len(json.dumps(record).encode("utf-8"))
+    return max(1, min(PINECONE_UPSERT_BATCH_SIZE, PINECONE_UPSERT_MAX_BYTES // record_bytes))
 
-def upsert_chunks(records: List[Dict], batch_size:int=96)-> int:
-    if not records:
+
+def upsert_chunks(records: Iterable[Dict], batch_size:Optional[int]=None)-> int:
+    """Upsert records into Pinecone and return how many were written.
+
+    records may be a generator (e.g. ingestion.iter_records): batches are uploaded
+    while later records are still being produced, and at most
+    PINECONE_UPSERT_MAX_PENDING batches are held in memory at once. Without an
+    explicit batch_size, batches are as large as the first record's size allows.
+    """
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
         return 0
     
-    source =records[0].get("source","")
+    source =first.get("source","")
     if source and is_file_ingested(source):
         print(f"{source} already exists in the Index. Skipping Ingestion")
         return 0
 
     index= _get_or_create_index()
-    total=0 
-
-    for i in range(0,len(records),batch_size):
-        batch=records[i:i+batch_size]
-
-        pinecone_records=[] 
-
-        for rec in batch:
-            pinecone_records.append(
-                {
-                    "_id": rec["id"],
-                    "chunk_text": rec["chunk_text"],
-                    "source": rec["source"],
-                    "pages": rec.get("pages",""),
-                }
-            )
-        
-        index.upsert_records(PINECONE_NAMESPACE,pinecone_records)
-        total+= len(pinecone_records)
 
-    print(f"Upserted {total} records into {PINECONE_INDEX_NAME}")
+    pinecone_records=(
+        {
+            "_id": rec["id"],
+            "chunk_text": rec["chunk_text"],
+            "source": rec["source"],
+            "pages": rec.get("pages",""),
+        }
+        for rec in chain([first], records)
+    )
+
+    if batch_size is None:
+        # Chunks are capped at CHUNK_SIZE characters, so the first record is a fair size estimate.
+        batch_size = _batch_size_for(first)
+
+    # upsert_records has no async_req option, so batches are sent from a thread pool
+    # sized to the index's connection pool rather than one round-trip at a time.
+    total=0
+    pending=deque()
+    submitted_ids=[]
+    try:
+        with ThreadPoolExecutor(max_workers=PINECONE_UPSERT_WORKERS) as pool:
+            for batch in _batched(pinecone_records, batch_size):
+                if len(pending) >= PINECONE_UPSERT_MAX_PENDING:
+                    future, count = pending.popleft()
+                    future.result()  # re-raises a failed batch
+                    total+= count
+                submitted_ids.extend(rec["_id"] for rec in batch)
+                pending.append((pool.submit(index.upsert_records, PINECONE_NAMESPACE, batch), len(batch)))
+
+            for future, count in pending:
+                future.result()
+                total+= count
+    except Exception:
+        # Records are produced while earlier batches upload, so a failure part-way
+        # (a bad page, a failed batch) leaves some of the file indexed, and
+        # is_file_ingested would then skip every retry. The pool has drained by now,
+        # so deleting what was submitted removes the partial upload.
+        _delete_records(index, submitted_ids)
+        raise
+    finally:
+        # New (or rolled-back) records can change the answer to any cached query.
+        clear_query_caches()
+        answer_cache.invalidate(source)
 
+    print(f"Upserted {total} records into {PINECONE_INDEX_NAME}")
     return total 
 
 
+def _delete_records(index: Index, ids: List[str]) -> None:
+    try:
+        for start in range(0, len(ids), PINECONE_DELETE_BATCH_SIZE):
+            index.delete(ids=ids[start:start + PINECONE_DELETE_BATCH_SIZE], namespace=PINECONE_NAMESPACE)
+    except Exception as e:
+        print(f"Rolling back {len(ids)} partially upserted records failed: {e}")
+
+
 if __name__== "__main__":
     test_records=[
         {"id": "test::chunk-0","chunk_text": "Google Showed a growth of 26 percentage in last 3 months","source":"test_pdf"},
@@ -1,78 +1,195 @@
 # Objective Take any PDF and Extract Text out of it and create Chunks of it
+import multiprocessing
 import os
-import re
-from typing import List, Dict
+import threading
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, Iterator, List
+import pypdfium2 as pdfium
 from pypdf import PdfReader
-from .config import CHUNK_SIZE, CHUNK_OVERLAP
+from .config import CHUNK_SIZE, CHUNK_OVERLAP, PDF_EXTRACT_WORKERS, PDF_PARALLEL_MIN_PAGES
 
 
 # Step 1: Extract Text from PDF
-def extract_pages_from_pdf(pdf_path: str) -> List[Dict]:
-    reader = PdfReader(pdf_path)
-    pages = []
-    for i, page in enumerate(reader.pages):
-        text = page.extract_text() or ""
+# PDFium is not thread-safe and /ingest runs in worker threads, so every pypdfium2
+# call in this process goes through this lock. It is taken per page rather than per
+# document so a slow consumer of the page iterator never blocks other extractions.
+# Reentrant because an abandoned page iterator may close its document from a garbage
+# collection triggered while this thread already holds the lock.
+_pdfium_lock = threading.RLock()
+
+def _close_pdfium(pdf: pdfium.PdfDocument) -> None:
+    with _pdfium_lock:
+        pdf.close()
+
+def _pdfium_page_texts(pdf: pdfium.PdfDocument, start: int, stop: int) -> Iterator[str]:
+    for i in range(start, stop):
+        with _pdfium_lock:
+            page = pdf[i]
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+        yield text
+
+def _pypdf_page_texts(reader: PdfReader, start: int, stop: int) -> Iterator[str]:
+    for i in range(start, stop):
+        yield reader.pages[i].extract_text() or ""
+
+def _extract_page_range(pdf_path: str, start: int, stop: int, use_pdfium: bool) -> List[str]:
+    # Runs in a worker process, so it opens its own document rather than pickling one.
+    if not use_pdfium:
+        return list(_pypdf_page_texts(PdfReader(pdf_path), start, stop))
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return list(_pdfium_page_texts(pdf, start, stop))
+    finally:
+        _close_pdfium(pdf)
+
+def iter_pages_from_pdf(pdf_path: str) -> Iterator[Dict]:
+    # PDFium (native code) extracts text several times faster than pypdf; pypdf stays
+    # as a fallback for documents PDFium refuses to open.
+    try:
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(pdf_path)
+            page_count = len(pdf)
+        use_pdfium = True
+    except pdfium.PdfiumError:
+        reader = PdfReader(pdf_path)
+        use_pdfium = False
+        page_count = len(reader.pages)
+
+    if PDF_EXTRACT_WORKERS <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        if use_pdfium:
+            try:
+                yield from _pages_with_text(_pdfium_page_texts(pdf, 0, page_count))
+            finally:
+                _close_pdfium(pdf)
+        else:
+            yield from _pages_with_text(_pypdf_page_texts(reader, 0, page_count))
+        return
+
+    if use_pdfium:
+        _close_pdfium(pdf)
+
+    # Extraction is CPU-bound (and pypdfium2 is not thread-safe), so pages are split
+    # across processes. Several ranges per worker keep slow pages from idling the rest.
+    step = -(-page_count // (PDF_EXTRACT_WORKERS * 4))
+    starts = range(0, page_count, step)
+    stops = [min(start + step, page_count) for start in starts]
+    extract = partial(_extract_page_range, pdf_path, use_pdfium=use_pdfium)
+    # Spawned rather than forked: this runs inside a server with live event-loop, anyio
+    # and ONNX Runtime threads, and forking while they hold locks can deadlock the child.
+    # Workers only import apps.ingestion and apps.config, so starting them is cheap.
+    spawn = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, mp_context=spawn) as pool:
+        # map() returns ranges in order as they finish, so pages stream out while
+        # later ranges are still being extracted.
+        texts = (
+            text
+            for chunk in pool.map(extract, starts, stops)
+            for text in chunk
+        )
+        yield from _pages_with_text(texts)
+
+def _pages_with_text(texts: Iterable[str]) -> Iterator[Dict]:
+    for i, text in enumerate(texts):
         if text.strip():  # Only add pages that have text
-            pages.append({"page_number": i + 1, "text": text})
-    return pages
+            yield {"page_number": i + 1, "text": text}
+
+def extract_pages_from_pdf(pdf_path: str) -> List[Dict]:
+    return list(iter_pages_from_pdf(pdf_path))
 
 def extract_pages_from_txt(txt_path: str) -> List[Dict]:
     with open(txt_path, 'r', encoding='utf-8') as file:
         return [{"page_number": 1, "text": file.read()}]
 
-def extract_pages(file_path: str) -> List[Dict]:
+def iter_pages(file_path: str) -> Iterator[Dict]:
     extension = os.path.splitext(file_path)[1].lower()
     if extension == '.pdf':
-        return extract_pages_from_pdf(file_path)
+        return iter_pages_from_pdf(file_path)
     elif extension in ('.txt', '.md'):
-        return extract_pages_from_txt(file_path)
+        return iter(extract_pages_from_txt(file_path))
     else:
         raise ValueError(f"Unsupported file type: {extension}")
 
+def extract_pages(file_path: str) -> List[Dict]:
+    return list(iter_pages(file_path))
+
 
 # Step 2: Create Chunks of Text
 def clean_text(text: str) -> str:
-    # Remove multiple spaces and newlines
-    return re.sub(r'\s+', ' ', text).strip()
+    # Remove multiple spaces and newlines. str.split() breaks on exactly the characters
+    # r'\s' matches, so this equals re.sub(r'\s+', ' ', text).strip() without the regex engine.
+    return " ".join(text.split())
 
-def create_chunks(pages: List[Dict], chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Dict]:
-    chunks = []
-    full_text = ""
-    page_map = []  # tracks which page each character belongs to
+def create_chunks(pages: Iterable[Dict], chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[Dict]:
+    """Yield overlapping chunks of the pages' concatenated text as soon as each is complete.
 
-    for page in pages:
-        text = clean_text(page["text"])
-        if text:
-            if full_text:
-                full_text += " "  # Add space between pages
-                page_map.append(page["page_number"])
-            full_text += text
-            page_map.extend([page["page_number"]] * len(text))
-
-    # Create chunks with overlap
-    for i in range(0, len(full_text), chunk_size - overlap):
-        chunk_text = full_text[i:i + chunk_size]
-        chunk_page_numbers = set(page_map[i:i + chunk_size])
-        chunks.append({
+    Only the tail of the text that later chunks can still reach is kept in memory.
+    """
+    step = chunk_size - overlap
+    if step <= 0:
+        raise ValueError(f"overlap ({overlap}) must be smaller than chunk_size ({chunk_size}).")
+    buffer = ""  # full_text[offset:]
+    offset = 0
+    length = 0  # len(full_text) so far
+    next_start = 0
+    # Offset in full_text where each page begins (including its joining space), so a
+    # chunk's pages come from a binary search instead of a per-character page map.
+    page_starts = []
+    page_nums = []
+
+    def make_chunk(i: int) -> Dict:
+        chunk_text = buffer[i - offset:i - offset + chunk_size]
+        first = bisect_right(page_starts, i) - 1
+        last = bisect_left(page_starts, i + len(chunk_text))
+        chunk_page_numbers = set(page_nums[first:last])
+        return {
             "chunk_text": chunk_text,
             "page_numbers": list(chunk_page_numbers)
-        })
+        }
 
-    return chunks
+    for page in pages:
+        text = clean_text(page["text"])
+        if not text:
+            continue
+        page_starts.append(length)
+        page_nums.append(page["page_number"])
+        sep = " " if length else ""  # Add space between pages
+        buffer = "".join((buffer, sep, text))
+        length += len(sep) + len(text)
 
+        while next_start + chunk_size <= length:
+            yield make_chunk(next_start)
+            next_start += step
+        buffer = buffer[next_start - offset:]
+        offset = next_start
 
-def ingest_document(file_path: str) -> List[Dict]:
+    # Remaining chunks run past the end of the text, as with range(0, len(full_text), step)
+    while next_start < length:
+        yield make_chunk(next_start)
+        next_start += step
+
+
+def iter_records(file_path: str) -> Iterator[Dict]:
+    """Yield Pinecone-ready records for file_path while the file is still being extracted."""
     file_name = os.path.basename(file_path)
-    pages = extract_pages(file_path)
-    chunks = create_chunks(pages)
-    records = []
-    for ix, chunk in enumerate(chunks):
+    ix = 0
+    for ix, chunk in enumerate(create_chunks(iter_pages(file_path)), 1):
         page_string = ",".join(str(num) for num in chunk["page_numbers"])
-        records.append({
-            "id": f"{file_name}::chunk_{ix+1}",
+        yield {
+            "id": f"{file_name}::chunk_{ix}",
             "chunk_text": chunk["chunk_text"],
             "source": file_name,
             "pages": page_string,
-        })
-    print(f"Processed '{file_name}'-- {len(chunks)} chunks created.")
-    return records
+        }
+    print(f"Processed '{file_name}'-- {ix} chunks created.")
+
+
+def ingest_document(file_path: str) -> List[Dict]:
+    return list(iter_records(file_path))
@@ -1,21 +1,39 @@
-from typing import List, Dict
+import asyncio
+from typing import List, Dict, Optional, Sequence, Tuple
 
-from pinecone import Pinecone
+import anyio
+import numpy as np
+from flashrank import Ranker, RerankRequest
+
+from .cache import rerank_cache
 from .retrieval import search as retrieve_search
 
 from .config import (
-    PINECONE_API_KEY,
-    PINECONE_INDEX_NAME,
-    PINECONE_NAMESPACE,
-    PINECONE_RERANK_MODEL,
+    FLASHRANK_CACHE_DIR,
+    FLASHRANK_MODEL,
+    RERANK_BATCH_TIMEOUT_MS,
+    RERANK_MAX_BATCH,
     RERANK_TOP_N,
     TOP_K
 )
 
 
-_pc = Pinecone(api_key=PINECONE_API_KEY)
+# Local ONNX cross-encoder; scores retrieved chunks in-process instead of a second Pinecone call.
+_ranker = Ranker(model_name=FLASHRANK_MODEL, cache_dir=FLASHRANK_CACHE_DIR)
+
+def rerank(
+    query: str,
+    top_k: int = TOP_K,
+    top_n: int = RERANK_TOP_N,
+    hits: Optional[List[Dict]] = None,
+    vector: Optional[Sequence[float]] = None,
+) -> List[Dict]:
+    """Rerank the top_k retrieved chunks for query and return the best top_n.
 
-def rerank(query: str, top_k: int = TOP_K, top_n: int = RERANK_TOP_N) -> List[Dict]:
+    Pass hits to rerank chunks that were already retrieved for query; otherwise
+    they are fetched with retrieval.search, reusing vector as the query
+    embedding when given.
+    """
     query = query.strip()
     if not query:
         return []
@@ -26,42 +44,169 @@ def rerank(query: str, top_k: int = TOP_K, top_n: int = RERANK_TOP_N) -> List[Di
 
     top_n = min(top_n, top_k)
 
-    if not _pc.has_index(PINECONE_INDEX_NAME):
-        raise ValueError(f"Pinecone index '{PINECONE_INDEX_NAME}' does not exist.")
-
-    index = _pc.Index(PINECONE_INDEX_NAME)
+    if hits is None:
+        hits = retrieve_search(query, top_k=top_k, vector=vector)
+    if not hits:
+        return []
 
-    reranked = index.search(
-        namespace=PINECONE_NAMESPACE,
-        query={
-            "top_k": top_k,
-            "inputs": {"text": query},
-        },
+    params = _cache_params(top_k, top_n, hits)
+    cached = rerank_cache.get(query, params)
+    if cached is not None:
+        return cached
 
-        rerank={
-            "model": PINECONE_RERANK_MODEL,
-            "top_n": top_n,
-            "rank_fields":["chunk_text"],
-        },
-        fields=["chunk_text", "source", "pages"]
+    request = RerankRequest(
+        query=query,
+        passages=[{"id": h["id"], "text": h["chunk_text"], "meta": h} for h in hits],
     )
 
-    hits = []
-
-    for item in reranked.get("result", {}).get("hits", []):
-        fields = item.get("fields", {})
-        hits.append(
-            {
-                "id": item.get("_id", ""),
-                "score": item.get("_score", 0.0),
-                "chunk_text": fields.get("chunk_text", ""),
-                "source": fields.get("source", ""),
-                "pages": fields.get("pages", ""),
-
-            }
-        )
-
-    return hits
+    reranked = []
+
+    for item in _ranker.rerank(request)[:top_n]:
+        reranked.append({**item["meta"], "score": float(item["score"])})
+
+    rerank_cache.set(query, reranked, params)
+    return reranked
+
+
+def _cache_params(top_k: int, top_n: int, hits: List[Dict]) -> Tuple:
+    # The reranked list depends on which hits were scored, not just on the query.
+    return (top_k, top_n, tuple(h["id"] for h in hits))
+
+
+def _score_pairs(pairs: List[Tuple[str, str]]) -> np.ndarray:
+    """Cross-encoder scores for (query, passage) pairs in one ONNX forward pass.
+
+    Mirrors Ranker.rerank's pairwise path, but the pairs may come from different
+    queries, which RerankRequest (one query per request) cannot express.
+    """
+    encoded = _ranker.tokenizer.encode_batch(pairs)
+    input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+    attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+    token_type_ids = np.array([e.type_ids for e in encoded], dtype=np.int64)
+
+    onnx_input = {"input_ids": input_ids, "attention_mask": attention_mask}
+    if token_type_ids.any():
+        onnx_input["token_type_ids"] = token_type_ids
+
+    logits = _ranker.session.run(None, onnx_input)[0]
+    if logits.shape[1] == 1:
+        return 1 / (1 + np.exp(-logits.flatten()))
+    exp_logits = np.exp(logits)
+    return exp_logits[:, 1] / np.sum(exp_logits, axis=1)
+
+
+def _rerank_batch(requests: List[Tuple[str, List[Dict], int]]) -> List[List[Dict]]:
+    """Rerank several (query, hits, top_n) requests with a single _score_pairs call."""
+    scores = _score_pairs([(query, h["chunk_text"]) for query, hits, _ in requests for h in hits])
+
+    results = []
+    offset = 0
+    for _, hits, top_n in requests:
+        hit_scores = scores[offset:offset + len(hits)]
+        offset += len(hits)
+        order = np.argsort(-hit_scores, kind="stable")[:top_n]
+        results.append([{**hits[i], "score": float(hit_scores[i])} for i in order])
+    return results
+
+
+class BatchedReranker:
+    """Coalesces concurrent rerank calls into one batched cross-encoder pass.
+
+    Requests wait up to timeout_ms for others to arrive (at most max_batch per
+    pass); the batch is then scored off the event loop in a worker thread.
+    Call start() and stop() from the running event loop (the API's lifespan).
+    """
+
+    def __init__(self, max_batch: int = RERANK_MAX_BATCH, timeout_ms: float = RERANK_BATCH_TIMEOUT_MS):
+        self.max_batch = max_batch
+        self.timeout = timeout_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        while not self._queue.empty():
+            future = self._queue.get_nowait()[-1]
+            if not future.done():
+                future.cancel()
+
+    async def rerank(
+        self,
+        query: str,
+        hits: List[Dict],
+        top_k: int = TOP_K,
+        top_n: int = RERANK_TOP_N,
+    ) -> List[Dict]:
+        """Async counterpart of rerank() for hits that were already retrieved."""
+        query = query.strip()
+        if not query or top_k <= 0 or top_n <= 0 or not hits:
+            return []
+
+        top_n = min(top_n, top_k)
+
+        params = _cache_params(top_k, top_n, hits)
+        cached = rerank_cache.get(query, params)
+        if cached is not None:
+            return cached
+
+        if self._worker is None:
+            # Not started (e.g. outside the API); score this request on its own.
+            return await anyio.to_thread.run_sync(rerank, query, top_k, top_n, hits)
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, hits, top_n, future))
+        reranked = await future
+
+        rerank_cache.set(query, reranked, params)
+        return reranked
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = []
+            try:
+                batch.append(await self._queue.get())
+                deadline = loop.time() + self.timeout
+                while len(batch) < self.max_batch:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+
+                results = await anyio.to_thread.run_sync(
+                    _rerank_batch, [(query, hits, top_n) for query, hits, top_n, _ in batch],
+                )
+            except asyncio.CancelledError:
+                for *_, future in batch:
+                    future.cancel()
+                raise
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (*_, future), reranked in zip(batch, results):
+                if not future.done():
+                    future.set_result(reranked)
+
+
+batched_reranker = BatchedReranker()
 
 
 if __name__ == "__main__":
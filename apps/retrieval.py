@@ -1,36 +1,96 @@
-from typing import List, Dict
+from functools import lru_cache
+from typing import List, Dict, Optional, Sequence, Tuple
 
 from pinecone import Pinecone
+from pinecone.db_data import Index
 
+from .cache import retrieval_cache
 from .config import (
     PINECONE_API_KEY,
     PINECONE_INDEX_NAME,
     PINECONE_NAMESPACE,
+    PINECONE_EMBED_MODEL,
+    QUERY_CACHE_MAXSIZE,
 )
 
 
 DEFAULT_TOP_K = 5
 _pc = Pinecone(api_key=PINECONE_API_KEY)
+_index: Optional[Index] = None
 
-def search(query: str, top_k: int = DEFAULT_TOP_K) -> List[Dict]:
+
+def _get_index() -> Index:
+    """Resolve the index once; later searches reuse the handle without a has_index call."""
+    global _index
+    if _index is None:
+        if not _pc.has_index(PINECONE_INDEX_NAME):
+            raise ValueError(f"Pinecone index '{PINECONE_INDEX_NAME}' does not exist.")
+        _index = _pc.Index(PINECONE_INDEX_NAME)
+    return _index
+
+
+def embed_query(query: str) -> Tuple[float, ...]:
+    """Embed query with the index's model so it can be searched by vector.
+
+    Callers that need the embedding more than once per request (search, the
+    semantic caches) should compute it once here and pass it along.
+    """
+    query = " ".join(query.split())
+    if not query:
+        return ()
+    return _embed(query)
+
+
+@lru_cache(maxsize=QUERY_CACHE_MAXSIZE)
+def _embed(query: str) -> Tuple[float, ...]:
+    embeddings = _pc.inference.embed(
+        model=PINECONE_EMBED_MODEL,
+        inputs=[query],
+        parameters={"input_type": "query", "truncate": "END"},
+    )
+    return tuple(embeddings[0].values)
+
+
+def search(query: str, top_k: int = DEFAULT_TOP_K, vector: Optional[Sequence[float]] = None) -> List[Dict]:
+    return search_with_origin(query, top_k, vector)[0]
+
+
+def search_with_origin(
+    query: str, top_k: int = DEFAULT_TOP_K, vector: Optional[Sequence[float]] = None,
+) -> Tuple[List[Dict], bool]:
+    """Like search, but also return True when the hits were borrowed from a similar
+    cached query (the semantic tier) instead of being retrieved for this query.
+
+    Borrowed hits are not independent evidence for this query, so callers must not
+    use them to validate a cached answer.
+    """
     query = query.strip()
     if not query:
-        return []
+        return [], False
 
-    if not _pc.has_index(PINECONE_INDEX_NAME):
-        raise ValueError(f"Pinecone index '{PINECONE_INDEX_NAME}' does not exist.")
+    cached = retrieval_cache.get(query, top_k)
+    if cached is not None:
+        return cached, False
 
-    index = _pc.Index(PINECONE_INDEX_NAME)
+    if vector is None:
+        vector = embed_query(query)
+    cached = retrieval_cache.get_similar(vector, top_k)
+    if cached is not None:
+        # Not stored under this query, so the exact tier only ever holds hits that
+        # were actually retrieved for its key.
+        return cached, True
 
-    results = index.search(
+    results = _get_index().search(
         namespace=PINECONE_NAMESPACE,
+        # Searching by vector stops Pinecone from embedding the query a second time.
         query={
             "top_k": top_k,
-            "inputs": {"text": query},
+            "vector": {"values": list(vector)},
         },
         fields=["chunk_text", "source", "pages"]
     )
 
+    # Every key is always set: api._hits_to_source_chunks reads them without .get defaults.
     hits = []
 
     for item in results.get("result", {}).get("hits", []):
@@ -46,7 +106,8 @@ def search(query: str, top_k: int = DEFAULT_TOP_K) -> List[Dict]:
             }
         )
 
-    return hits
+    retrieval_cache.set(query, hits, top_k, vector)
+    return hits, False
 
 
 if __name__ == "__main__":
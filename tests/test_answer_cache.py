@@ -0,0 +1,70 @@
+import unittest
+
+from apps.answer_cache import AnswerCache, _renumber_citations
+
+
+def chunks(*ids):
+    return [{"id": chunk_id, "source": chunk_id.split("::")[0]} for chunk_id in ids]
+
+
+QUESTION = [1.0, 0.0, 0.0]
+ANSWER = (
+    "Revenue was $5 billion [1], and margin was 30% [3].\n"
+    "\n"
+    "References:\n"
+    "[1] a.pdf, p.1\n"
+    "[3] c.pdf, p.3"
+)
+
+
+class RenumberCitationsTest(unittest.TestCase):
+    def test_citations_follow_the_new_chunk_order(self):
+        answer = _renumber_citations(ANSWER, ["a::1", "b::1", "c::1"], ["c::1", "a::1", "b::1", "d::1"])
+        self.assertEqual(answer, (
+            "Revenue was $5 billion [2], and margin was 30% [1].\n"
+            "\n"
+            "References:\n"
+            "[1] c.pdf, p.3\n"
+            "[2] a.pdf, p.1"
+        ))
+
+    def test_unchanged_order_is_left_alone(self):
+        ids = ["a::1", "b::1", "c::1"]
+        self.assertEqual(_renumber_citations(ANSWER, ids, ids), ANSWER)
+
+    def test_missing_cited_chunk_is_a_miss(self):
+        self.assertIsNone(_renumber_citations(ANSWER, ["a::1", "b::1", "c::1"], ["a::1", "b::1"]))
+
+    def test_citation_outside_the_old_chunks_is_a_miss(self):
+        self.assertIsNone(_renumber_citations("See [4].", ["a::1", "b::1"], ["a::1", "b::1"]))
+
+
+class AnswerCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = AnswerCache(maxsize=8, similarity=0.9, min_overlap=0.7)
+        self.cache.set(QUESTION, chunks("a::1", "b::1", "c::1"), ANSWER)
+
+    def test_hit_renumbers_citations(self):
+        answer = self.cache.get([0.99, 0.05, 0.0], chunks("c::1", "a::1", "b::1"))
+        self.assertIn("Revenue was $5 billion [2], and margin was 30% [1].", answer)
+
+    def test_dissimilar_question_misses(self):
+        self.assertIsNone(self.cache.get([0.0, 1.0, 0.0], chunks("a::1", "b::1", "c::1")))
+
+    def test_low_chunk_overlap_misses(self):
+        self.assertIsNone(self.cache.get(QUESTION, chunks("a::1", "c::1", "d::1", "e::1")))
+
+    def test_missing_cited_chunk_misses(self):
+        cache = AnswerCache(maxsize=8, similarity=0.9, min_overlap=0.5)
+        cache.set(QUESTION, chunks("a::1", "b::1", "c::1"), ANSWER)
+        self.assertIsNone(cache.get(QUESTION, chunks("a::1", "b::1")))
+
+    def test_invalidate_drops_answers_grounded_in_source(self):
+        self.cache.invalidate("other")
+        self.assertIsNotNone(self.cache.get(QUESTION, chunks("a::1", "b::1", "c::1")))
+        self.cache.invalidate("b")
+        self.assertIsNone(self.cache.get(QUESTION, chunks("a::1", "b::1", "c::1")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import random
+import unittest
+
+from apps.ingestion import clean_text, create_chunks
+
+
+def reference_chunks(pages, chunk_size, overlap):
+    """The original whole-document chunker, kept as the behaviour create_chunks must match.
+
+    Chunk IDs and page citations are derived from this output, so any change to it
+    changes what is stored in Pinecone.
+    """
+    full_text = ""
+    page_map = []  # page of each character; a joining space belongs to the next page
+    for page in pages:
+        text = clean_text(page["text"])
+        if text:
+            if full_text:
+                full_text += " "
+                page_map.append(page["page_number"])
+            full_text += text
+            page_map.extend([page["page_number"]] * len(text))
+    return [
+        (full_text[i:i + chunk_size], sorted(set(page_map[i:i + chunk_size])))
+        for i in range(0, len(full_text), chunk_size - overlap)
+    ]
+
+
+def chunks_of(pages, chunk_size, overlap):
+    return [
+        (c["chunk_text"], sorted(c["page_numbers"]))
+        for c in create_chunks(iter(pages), chunk_size=chunk_size, overlap=overlap)
+    ]
+
+
+class CreateChunksTest(unittest.TestCase):
+    def test_text_shorter_than_one_chunk(self):
+        pages = [{"page_number": 1, "text": "  hello \n\t world  "}]
+        self.assertEqual(chunks_of(pages, 512, 64), [("hello world", [1])])
+
+    def test_no_text(self):
+        self.assertEqual(chunks_of([], 512, 64), [])
+        self.assertEqual(chunks_of([{"page_number": 1, "text": " \n "}], 512, 64), [])
+
+    def test_empty_pages_are_skipped(self):
+        pages = [
+            {"page_number": 1, "text": "alpha"},
+            {"page_number": 2, "text": "   "},
+            {"page_number": 3, "text": ""},
+            {"page_number": 4, "text": "beta"},
+        ]
+        self.assertEqual(chunks_of(pages, 512, 64), [("alpha beta", [1, 4])])
+
+    def test_chunks_across_page_boundaries(self):
+        pages = [
+            {"page_number": 1, "text": "aaaa bbbb"},
+            {"page_number": 2, "text": "cccc"},
+            {"page_number": 3, "text": "dddd eeee ffff"},
+        ]
+        # full text: "aaaa bbbb cccc dddd eeee ffff", step 8; the space joining two
+        # pages counts as part of the later page.
+        self.assertEqual(chunks_of(pages, 10, 2), [
+            ("aaaa bbbb ", [1, 2]),
+            ("b cccc ddd", [1, 2, 3]),
+            ("ddd eeee f", [3]),
+            (" ffff", [3]),
+        ])
+
+    def test_matches_reference_on_random_pages(self):
+        rng = random.Random(1)
+        for trial in range(300):
+            pages = [
+                {
+                    "page_number": i + 1,
+                    "text": rng.choice([
+                        "",
+                        " \n ",
+                        " ".join("w" * rng.randint(1, 9) for _ in range(rng.randint(1, 200))),
+                    ]),
+                }
+                for i in range(rng.randint(0, 12))
+            ]
+            chunk_size, overlap = rng.choice([(512, 64), (50, 10), (7, 3), (20, 0), (1, 0)])
+            self.assertEqual(
+                chunks_of(pages, chunk_size, overlap),
+                reference_chunks(pages, chunk_size, overlap),
+                f"trial {trial}",
+            )
+
+    def test_overlap_must_be_smaller_than_chunk_size(self):
+        pages = [{"page_number": 1, "text": "x" * 500}]
+        for overlap in (64, 100):
+            with self.assertRaises(ValueError):
+                list(create_chunks(pages, chunk_size=64, overlap=overlap))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import threading
+import unittest
+from unittest import mock
+
+# apps.embedding builds its Pinecone client at import; no request is made with this key.
+os.environ.setdefault("PINECONE_API_KEY", "test-key")
+
+from apps import embedding
+from apps.cache import retrieval_cache
+
+
+class FakeIndex:
+    def __init__(self, fail_upsert_after=None):
+        self.fail_upsert_after = fail_upsert_after
+        self.upserted = []
+        self.deleted = []
+        self._lock = threading.Lock()
+
+    def upsert_records(self, namespace, records):
+        with self._lock:
+            if self.fail_upsert_after is not None and len(self.upserted) >= self.fail_upsert_after:
+                raise RuntimeError("upsert failed")
+            self.upserted.append([r["_id"] for r in records])
+
+    def delete(self, ids, namespace):
+        self.deleted.extend(ids)
+
+
+def _records(count, fail_at=None):
+    for i in range(count):
+        if i == fail_at:
+            raise ValueError("corrupt page")
+        yield {"id": f"doc.pdf::chunk_{i + 1}", "chunk_text": f"text {i}", "source": "doc.pdf", "pages": "1"}
+
+
+class UpsertChunksTest(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.object(embedding, "is_file_ingested", return_value=False),
+            mock.patch.object(embedding, "_get_or_create_index", side_effect=lambda: self.index),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        retrieval_cache.clear()
+
+    def test_streams_every_record(self):
+        self.index = FakeIndex()
+        self.assertEqual(embedding.upsert_chunks(_records(5), batch_size=2), 5)
+        self.assertEqual(sorted(i for batch in self.index.upserted for i in batch),
+                         sorted(r["id"] for r in _records(5)))
+        self.assertEqual(self.index.deleted, [])
+
+    def test_failing_records_roll_back_uploaded_batches(self):
+        self.index = FakeIndex()
+        retrieval_cache.set("question", [{"id": "stale"}])
+
+        with self.assertRaises(ValueError):
+            embedding.upsert_chunks(_records(5, fail_at=3), batch_size=2)
+
+        uploaded = [i for batch in self.index.upserted for i in batch]
+        self.assertTrue(uploaded, "the first batch should have been sent before the failure")
+        self.assertEqual(sorted(self.index.deleted), sorted(uploaded))
+        self.assertIsNone(retrieval_cache.get("question"))
+
+    def test_failing_batch_rolls_back_the_others(self):
+        self.index = FakeIndex(fail_upsert_after=1)
+
+        with self.assertRaises(RuntimeError):
+            embedding.upsert_chunks(_records(6), batch_size=2)
+
+        uploaded = {i for batch in self.index.upserted for i in batch}
+        self.assertTrue(uploaded <= set(self.index.deleted))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+import pypdfium2 as pdfium
+
+from apps import ingestion
+from apps.config import PDF_PARALLEL_MIN_PAGES
+from apps.ingestion import extract_pages_from_pdf
+
+
+DOCS = Path(__file__).resolve().parent.parent / "docs"
+
+
+class ConcurrentPdfExtractionTest(unittest.TestCase):
+    def test_threads_extract_same_pages_as_serial(self):
+        # /ingest extracts PDFs in worker threads. Unserialized PDFium calls from
+        # several threads return garbled text or crash the interpreter.
+        pdfs = sorted(DOCS.glob("*.pdf"))
+        self.assertTrue(pdfs)
+        expected = {pdf: extract_pages_from_pdf(str(pdf)) for pdf in pdfs}
+        self.assertTrue(
+            any(len(pages) < PDF_PARALLEL_MIN_PAGES for pages in expected.values()),
+            "needs a PDF small enough to be extracted in-process",
+        )
+
+        jobs = [pdf for pdf in pdfs for _ in range(24)]
+        with ThreadPoolExecutor(max_workers=12) as pool:
+            results = list(pool.map(lambda pdf: extract_pages_from_pdf(str(pdf)), jobs))
+
+        for pdf, pages in zip(jobs, results):
+            self.assertEqual(pages, expected[pdf], pdf.name)
+
+
+class ParallelPdfExtractionTest(unittest.TestCase):
+    # The sample PDFs are all below PDF_PARALLEL_MIN_PAGES, so the thresholds are
+    # lowered to send them through the spawned process pool.
+    PDFS = [DOCS / "Apple_Q24.pdf", DOCS / "mongodb.pdf"]
+
+    def assert_pool_matches_serial(self):
+        for pdf in self.PDFS:
+            serial = extract_pages_from_pdf(str(pdf))
+            with mock.patch.object(ingestion, "PDF_PARALLEL_MIN_PAGES", 1), \
+                    mock.patch.object(ingestion, "PDF_EXTRACT_WORKERS", 4), \
+                    mock.patch.object(ingestion, "ProcessPoolExecutor", wraps=ProcessPoolExecutor) as pool:
+                parallel = extract_pages_from_pdf(str(pdf))
+            pool.assert_called_once()
+            self.assertTrue(serial)
+            self.assertEqual(parallel, serial, pdf.name)
+
+    def test_pdfium_pool_matches_serial(self):
+        self.assert_pool_matches_serial()
+
+    def test_pypdf_pool_matches_serial(self):
+        # Making PDFium refuse the file in this process switches both paths to pypdf;
+        # the worker processes are then told to use pypdf too.
+        refuse = mock.patch.object(
+            ingestion.pdfium, "PdfDocument", side_effect=pdfium.PdfiumError("refused"),
+        )
+        with refuse:
+            self.assert_pool_matches_serial()
+
+
+if __name__ == "__main__":
+    unittest.main()